@@ -0,0 +1,59 @@
+`default_nettype none
+`timescale 1ns / 1ps
+
+/* Testbench-only SPI master. The cocotb test loads a 16-bit word
+   ({r_w, address[6:0], data[7:0]}) and pulses start; this module then
+   shifts the word out MSB first on COPI (mode 0) and raises done once
+   nCS has returned high, so Python is not woken on every SCLK edge.
+*/
+module spi_master #(
+    parameter SETUP_NS     = 100,  // nCS low to first SCLK low
+    parameter HALF_SCLK_NS = 5000  // Half of the 10 us SCLK period
+) (
+    input  wire        start,  // Rising edge starts a transaction
+    input  wire [15:0] word,   // Word to shift out, MSB first
+    output reg         ncs,
+    output reg         sclk,
+    output reg         copi,
+    output reg         busy,   // High while the master owns the SPI pins
+    output reg         done    // Rises when the transaction has finished
+);
+
+  reg [15:0] shift_reg;
+  integer i;
+
+  initial begin
+    ncs  = 1'b1;
+    sclk = 1'b0;
+    copi = 1'b0;
+    busy = 1'b0;
+    done = 1'b0;
+  end
+
+  always @(posedge start) begin
+    shift_reg = word;
+    done = 1'b0;
+    busy = 1'b1;
+    // Start transaction - pull CS low
+    ncs  = 1'b0;
+    sclk = 1'b0;
+    copi = 1'b0;
+    #(SETUP_NS);
+    for (i = 15; i >= 0; i = i - 1) begin
+      // SCLK low, set COPI
+      sclk = 1'b0;
+      copi = shift_reg[i];
+      #(HALF_SCLK_NS);
+      // SCLK high, keep COPI
+      sclk = 1'b1;
+      #(HALF_SCLK_NS);
+    end
+    // End transaction - return CS high
+    sclk = 1'b0;
+    copi = 1'b0;
+    ncs  = 1'b1;
+    busy = 1'b0;
+    done = 1'b1;
+  end
+
+endmodule
@@ -7,11 +7,14 @@
 module tb ();
 
   // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
+  // Verilator runs skip this; run `make WAVES=1` to have Verilator write dump.vcd instead.
+`ifndef VERILATOR
   initial begin
     $dumpfile("tb.vcd");
     $dumpvars(0, tb);
     #1;
   end
+`endif
 
   // Wire up the inputs and outputs:
   reg clk;
@@ -22,11 +25,39 @@ module tb ();
   wire [7:0] uo_out;
   wire [7:0] uio_out;
   wire [7:0] uio_oe;
+  // uo_out[0] as a scalar so the PWM tests can trigger on its edges:
+  wire pwm_out = uo_out[0];
 `ifdef GL_TEST
   wire VPWR = 1'b1;
   wire VGND = 1'b0;
 `endif
 
+  // Generate the 10 MHz clock in the simulator rather than from cocotb:
+  initial clk = 1'b0;
+  always #50 clk = ~clk;
+
+  // SPI master driven by the cocotb test through spi_word / spi_start:
+  reg spi_start;
+  reg [15:0] spi_word;
+  wire spi_ncs;
+  wire spi_sclk;
+  wire spi_copi;
+  wire spi_busy;
+  wire spi_done;
+
+  spi_master spi_master_inst (
+      .start(spi_start),
+      .word (spi_word),
+      .ncs  (spi_ncs),
+      .sclk (spi_sclk),
+      .copi (spi_copi),
+      .busy (spi_busy),
+      .done (spi_done)
+  );
+
+  // The SPI master owns ui_in[2:0] (nCS, COPI, SCLK) during a transaction:
+  wire [7:0] dut_ui_in = spi_busy ? {ui_in[7:3], spi_ncs, spi_copi, spi_sclk} : ui_in;
+
   // Replace tt_um_example with your module name:
   tt_um_uwasic_onboarding_herman_gahra user_project (
 
@@ -36,7 +67,7 @@ module tb ();
       .VGND(VGND),
 `endif
 
-      .ui_in  (ui_in),    // Dedicated inputs
+      .ui_in  (dut_ui_in),  // Dedicated inputs
       .uo_out (uo_out),   // Dedicated outputs
       .uio_in (uio_in),   // IOs: Input path
       .uio_out(uio_out),  // IOs: Output path
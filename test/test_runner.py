@@ -0,0 +1,36 @@
+# SPDX-FileCopyrightText: © 2024 Tiny Tapeout
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+
+import pytest
+from cocotb_test.simulator import run
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(TEST_DIR, "..", "src")
+PROJECT_SOURCES = ["project.v", "pwm_peripheral.v", "spi_peripheral.v"]
+SIM = os.environ.get("SIM", "verilator")
+# Keep in sync with the Verilator flags in the Makefile
+VERILATOR_ARGS = [
+    "--timing", "--timescale", "1ns/1ps",
+    "-O3", "--x-assign", "fast", "--x-initial", "fast", "--threads", "1",
+    "-Wno-WIDTH", "-Wno-UNUSED", "-Wno-UNDRIVEN",
+]
+
+@pytest.mark.parametrize("testcase", ["test_spi", "test_pwm_freq", "test_pwm_duty"])
+def test_rtl(testcase):
+    """Run a single cocotb test from test.py in its own simulator process."""
+    run(
+        simulator=SIM,
+        verilog_sources=[os.path.join(SRC_DIR, source) for source in PROJECT_SOURCES]
+        + [os.path.join(TEST_DIR, "spi_master.v"), os.path.join(TEST_DIR, "tb.v")],
+        includes=[SRC_DIR],
+        toplevel="tb",
+        module="test",
+        testcase=testcase,
+        python_search=[TEST_DIR],
+        extra_args=VERILATOR_ARGS if SIM == "verilator" else [],
+        # Separate build directories so parallel runs don't share tb.vcd/results.xml
+        sim_build=os.path.join(TEST_DIR, "sim_build", testcase),
+        extra_env={"COCOTB_LOG_LEVEL": os.environ.get("COCOTB_LOG_LEVEL", "WARNING")},
+    )